@@ -4,13 +4,17 @@ from PySide6.QtWidgets import (
     QSplitter,
     QSpacerItem,
     QFileDialog,
-    QSizePolicy, QVBoxLayout, QLineEdit, QPushButton, QHBoxLayout, QMessageBox, QApplication
+    QSizePolicy, QVBoxLayout, QLineEdit, QPushButton, QHBoxLayout, QMessageBox, QApplication,
+    QProgressDialog
 )
 from PySide6.QtGui import QColor
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QThreadPool
 from codeeditor import CodeEditor
 from trackinglineedit import TrackingLineEdit
 from file import File
+from fileworker import FileWorker, LoadWorker, RevisionLoadWorker, SaveWorker, PatchApplyWorker, iter_text_chunks, chunk_count
+from gitreader import GitObjectReader, parse_revision_spec
+from patch import iter_unified_diff, diff_line_count, split_lines
 from session import Session
 
 class DualViewer(QMainWindow):
@@ -25,7 +29,7 @@ class DualViewer(QMainWindow):
 
         # Create top bar for editor1
         self.textbox1 = TrackingLineEdit()
-        self.textbox1.setPlaceholderText("Path for Left file compare...")
+        self.textbox1.setPlaceholderText("Path (or rev:path) for Left file compare...")
         self.button1 = QPushButton("...")
         self.textbox1.reloadEditor.connect(self.reloadWithPopup)
         self.textbox1.returnPressed.connect(self.textBoxEnterKey)
@@ -43,7 +47,7 @@ class DualViewer(QMainWindow):
 
         # Create top bar for editor2
         self.textbox2 = TrackingLineEdit()
-        self.textbox2.setPlaceholderText("Path for Right file compare...")
+        self.textbox2.setPlaceholderText("Path (or rev:path) for Right file compare...")
         self.button2 = QPushButton("...")
         self.textbox2.reloadEditor.connect(self.reloadWithPopup)
         self.textbox2.returnPressed.connect(self.textBoxEnterKey)
@@ -78,6 +82,11 @@ class DualViewer(QMainWindow):
         self.setCentralWidget(container)
         self.resize(1000, 600)
 
+        # Patch menu
+        patch_menu = self.menuBar().addMenu("Patch")
+        patch_menu.addAction("Export Patch...", self.exportPatch)
+        patch_menu.addAction("Apply Patch to Left...", self.applyPatch)
+
         # Quit Capture
         app.aboutToQuit.connect(self.exit)
 
@@ -85,6 +94,15 @@ class DualViewer(QMainWindow):
         self.editor1_cache = File()
         self.editor2_cache = File()
 
+        # Background file I/O: the latest load per side, and every running worker
+        self.load_workers = {}
+        self.active_workers = set()
+
+        # Last diff result, kept for patch export
+        self.diff_lines = ([], [])
+        self.diff_opcodes = []
+        self.apply_worker = None
+
         # Session Data
         self.session = Session()
         self.session.load_session_data()
@@ -102,6 +120,12 @@ class DualViewer(QMainWindow):
         self.session.session_data.last_right_file = self.textbox2.text()
         self.session.save_session_data()
 
+        # Abandon pending loads, but let in-flight saves finish
+        for worker in self.load_workers.values():
+            worker.cancel()
+        QThreadPool.globalInstance().waitForDone()
+        GitObjectReader().close()
+
     def textBoxEnterKey(self):
         sender = self.sender()
         self.loadFile(sender.text(), sender)
@@ -122,15 +146,10 @@ class DualViewer(QMainWindow):
         file2, _ = QFileDialog.getOpenFileName(self, "Open Second File")
 
         if file1 and file2:
-            with open(file1, 'r', encoding='utf-8') as f1:
-                content1 = f1.readlines()
-            with open(file2, 'r', encoding='utf-8') as f2:
-                content2 = f2.readlines()
-
-            self.editor1.setPlainText("".join(content1))
-            self.editor2.setPlainText("".join(content2))
-
-            self.diff_files(content1, content2)
+            self.textbox1.setText(file1)
+            self.textbox2.setText(file2)
+            self.loadFile(file1, self.textbox1)
+            self.loadFile(file2, self.textbox2)
 
     def browseFile(self):
         sender = self.sender()
@@ -143,26 +162,79 @@ class DualViewer(QMainWindow):
 
             self.loadFile(filename, sender)
 
-    def saveFile(self, filename:str, contents:list[str]):
-        try:
-            with open(filename, 'w', encoding='utf-8') as file:
-                file.writelines(contents)
-        except Exception as e:
-            QMessageBox.critical(self, "Save File Error", f"Could not save file:\n{e}")
+    def startWorker(self, worker: FileWorker, label: str):
+        # Progress only pops up for operations that take a noticeable time
+        progress = QProgressDialog(label, "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.NonModal)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(worker.cancel)
+        worker.signals.progress.connect(progress.setValue)
+
+        def cleanup(*_):
+            self.active_workers.discard(worker)
+            progress.close()
+            progress.deleteLater()
+
+        worker.signals.finished.connect(cleanup)
+        worker.signals.failed.connect(cleanup)
+        worker.signals.cancelled.connect(cleanup)
+
+        self.active_workers.add(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    def saveFile(self, filename: str, text: str) -> SaveWorker | None:
+        # Blobs in git history are read-only
+        if parse_revision_spec(filename):
+            QMessageBox.critical(self, "Save File Error", f"Could not save file:\n{filename} is a git revision")
+            return None
+
+        # Text typed into a pane that never had a file loaded
+        if filename.strip() == '':
+            filename, _ = QFileDialog.getSaveFileName(self, "Save File As")
+            if filename == '':
+                return None
+
+        worker = SaveWorker(filename, iter_text_chunks(text), chunk_count(text))
+        worker.signals.failed.connect(
+            lambda error: QMessageBox.critical(self, "Save File Error", f"Could not save file:\n{error}")
+        )
+        self.startWorker(worker, 'Saving {}...'.format(filename))
+        return worker
 
     def loadFile(self, filename: str, sender: TrackingLineEdit | QPushButton):
         # UX logic
         if sender == self.textbox1 or sender == self.button1:
             side = 'Left'
+            editor = self.editor1
             cache = self.editor1_cache
-            body = self.editor1.toPlainText().splitlines(keepends=True)
         else:
             side = 'Right'
+            editor = self.editor2
             cache = self.editor2_cache
-            body = self.editor2.toPlainText().splitlines(keepends=True)
+        text = editor.toPlainText()
 
         # If the old file changed, prompt to save
-        if body != cache.body:
+        save_worker = None
+        if text != cache.body_as_string() and parse_revision_spec(cache.filename):
+            # A git revision cannot be saved in place, so offer Save As or discard
+            reply = QMessageBox.question(
+                self,
+                'Discard Changes?',
+                '{} File Contents Changed, but {} is a git revision. Save to a new file?'.format(side, cache.filename),
+                QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel,
+                QMessageBox.Cancel
+            )
+
+            if reply == QMessageBox.Save:
+                # An empty name makes saveFile ask for one
+                save_worker = self.saveFile('', text)
+                if save_worker is None:
+                    self.restorePath(side)
+                    return
+            elif reply != QMessageBox.Discard:
+                self.restorePath(side)
+                return
+        elif text != cache.body_as_string():
             reply = QMessageBox.question(
                 self,
                 'Save Changes?',
@@ -173,34 +245,156 @@ class DualViewer(QMainWindow):
 
             # Handle the response
             if reply == QMessageBox.Yes:
-                self.saveFile(cache.filename, body)
+                save_worker = self.saveFile(cache.filename, text)
+                if save_worker is None:
+                    self.restorePath(side)
+                    return
             elif reply == QMessageBox.NoButton:
                 return
-            
-        # Open the file
-        try:
-            with open(filename, 'r') as file:
-                lines = file.readlines()
-        except Exception as e:
-            lines = [str(e)]
+
+        # Only the most recent load for a side is allowed to fill its editor
+        previous = self.load_workers.get(side)
+        if previous is not None:
+            previous.cancel()
+
+        # A patch being applied to the left file would land on the new one
+        if side == 'Left' and self.apply_worker is not None:
+            self.apply_worker.cancel()
+            self.apply_worker = None
+
+        # Open the file (or git blob for 'rev:path') in the background
+        if parse_revision_spec(filename):
+            worker = RevisionLoadWorker(filename)
+        else:
+            worker = LoadWorker(filename)
+        worker.signals.finished.connect(lambda lines: self.fileLoaded(worker, side, filename, lines))
+        worker.signals.failed.connect(lambda error: self.fileLoaded(worker, side, filename, [error]))
+        worker.signals.cancelled.connect(lambda: self.loadCancelled(worker, side))
+        self.load_workers[side] = worker
+        label = 'Loading {}...'.format(filename)
+
+        # Typing during the load would be overwritten when it finishes
+        editor.setReadOnly(True)
+
+        # The new path may be the file being saved, so let the save finish
+        # first. If the save does not go through, keep the edits and skip the load
+        if save_worker is None:
+            self.startWorker(worker, label)
+        else:
+            save_worker.signals.finished.connect(lambda *_: self.startWorker(worker, label))
+            save_worker.signals.failed.connect(lambda *_: self.loadCancelled(worker, side))
+            save_worker.signals.cancelled.connect(lambda: self.loadCancelled(worker, side))
+
+    def restorePath(self, side: str):
+        # Put back the path of the file the editor actually holds
+        textbox = self.textbox1 if side == 'Left' else self.textbox2
+        cache = self.editor1_cache if side == 'Left' else self.editor2_cache
+        textbox.setText(cache.filename)
+        textbox._original_text = cache.filename
+
+    def loadCancelled(self, worker: LoadWorker, side: str):
+        if self.load_workers.get(side) is not worker:
+            return
+        del self.load_workers[side]
+
+        editor = self.editor1 if side == 'Left' else self.editor2
+        editor.setReadOnly(False)
+        self.restorePath(side)
+
+    def fileLoaded(self, worker: LoadWorker, side: str, filename: str, lines: list[str]):
+        if self.load_workers.get(side) is not worker:
+            return
+        del self.load_workers[side]
+
+        editor = self.editor1 if side == 'Left' else self.editor2
+        editor.setReadOnly(False)
 
         # Dump lines to editors and Cache file details
-        if sender == self.textbox1 or sender == self.button1:
+        if side == 'Left':
             self.fillEditor(lines, self.editor1)
             self.editor1_cache = File(filename, lines)
         else:
             self.fillEditor(lines, self.editor2)
-            self.editor2_cache = File(filename, lines)            
+            self.editor2_cache = File(filename, lines)
+
+        self.diffEditors()
 
-        # Diff it
+    def diffEditors(self):
         try:
-            self.diff_files(self.editor1.toPlainText().splitlines(keepends=True), self.editor2.toPlainText().splitlines(keepends=True))
+            self.diff_files(split_lines(self.editor1.toPlainText()), split_lines(self.editor2.toPlainText()))
         except Exception as e:
             QMessageBox.critical(self, "File Diff Error", str(e))
-    
+
     def fillEditor(self, contents, editor):
         editor.setPlainText("".join(contents))
 
+    def exportPatch(self):
+        # Re-diff so edits made since the last load are included
+        self.diffEditors()
+        lines1, lines2 = self.diff_lines
+        total = diff_line_count(self.diff_opcodes)
+        if total == 0:
+            QMessageBox.information(self, "Export Patch", "The files are identical.")
+            return
+
+        filename, _ = QFileDialog.getSaveFileName(self, "Export Patch", "", "Patch Files (*.patch *.diff);;All Files (*)")
+        if filename == '':
+            return
+
+        chunks = iter_unified_diff(lines1, lines2, self.diff_opcodes, self.editor1_cache.filename, self.editor2_cache.filename)
+        worker = SaveWorker(filename, chunks, total)
+        worker.signals.failed.connect(
+            lambda error: QMessageBox.critical(self, "Export Patch Error", f"Could not export patch:\n{error}")
+        )
+        self.startWorker(worker, 'Exporting {}...'.format(filename))
+
+    def applyPatch(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Apply Patch to Left", "", "Patch Files (*.patch *.diff);;All Files (*)")
+        if filename == '':
+            return
+
+        # Only the latest apply may fill the editor
+        if self.apply_worker is not None:
+            self.apply_worker.cancel()
+
+        worker = PatchApplyWorker(filename, self.editor1.toPlainText())
+        worker.signals.finished.connect(lambda result: self.patchApplied(worker, result))
+        worker.signals.failed.connect(lambda error: self.patchFailed(worker, error))
+        worker.signals.cancelled.connect(lambda: self.patchFailed(worker, None))
+        self.apply_worker = worker
+        self.startWorker(worker, 'Applying {}...'.format(filename))
+
+    def patchFailed(self, worker: PatchApplyWorker, error: str | None):
+        if self.apply_worker is not worker:
+            return
+        self.apply_worker = None
+
+        if error is not None:
+            QMessageBox.critical(self, "Apply Patch Error", f"Could not apply patch:\n{error}")
+
+    def patchApplied(self, worker: PatchApplyWorker, result: tuple[list[str], list[int]]):
+        if self.apply_worker is not worker:
+            return
+        self.apply_worker = None
+
+        # Don't overwrite typing or a load that happened while the patch was applied
+        if self.editor1.toPlainText() != worker.text:
+            QMessageBox.warning(self, "Apply Patch", "The left file changed while the patch was being applied. The patch was not applied.")
+            return
+
+        lines, failed = result
+
+        # The editor is left modified so the usual save prompt still applies
+        self.fillEditor(lines, self.editor1)
+        self.diffEditors()
+
+        if failed:
+            QMessageBox.warning(
+                self,
+                "Apply Patch",
+                "{} hunk(s) could not be applied: {}".format(len(failed), ", ".join(str(n) for n in failed))
+            )
+
     def reloadWithPopup(self, sender: TrackingLineEdit):
         reply = QMessageBox.question(
             self,
@@ -215,27 +409,23 @@ class DualViewer(QMainWindow):
         
 
     def diff_files(self, lines1, lines2):
-        differ = difflib.Differ()
-        diff = list(differ.compare(lines1, lines2))
+        # Line-level opcodes, the same matching difflib.unified_diff uses. They
+        # are kept as the hunk data for patch export
+        opcodes = difflib.SequenceMatcher(None, lines1, lines2).get_opcodes()
+        self.diff_lines = (lines1, lines2)
+        self.diff_opcodes = opcodes
 
         # Line color mapping
         editor1_colors = {}
         editor2_colors = {}
 
-        i1 = i2 = 0
-        for line in diff:
-            if line.startswith("  "):  # same
-                i1 += 1
-                i2 += 1
-            elif line.startswith("- "):  # line in file1 only
-                editor1_colors[i1] = QColor("#ffdddd")  # red-ish
-                i1 += 1
-            elif line.startswith("+ "):  # line in file2 only
-                editor2_colors[i2] = QColor("#ddffdd")  # green-ish
-                i2 += 1
-            elif line.startswith("? "):  # line with a change indicator (not always useful)
-                # optionally add yellow to mark changed lines
-                pass
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag in ("replace", "delete"):  # lines in file1 only
+                for i in range(i1, i2):
+                    editor1_colors[i] = QColor("#ffdddd")  # red-ish
+            if tag in ("replace", "insert"):  # lines in file2 only
+                for j in range(j1, j2):
+                    editor2_colors[j] = QColor("#ddffdd")  # green-ish
 
         self.editor1.apply_line_backgrounds(editor1_colors)
         self.editor2.apply_line_backgrounds(editor2_colors)
@@ -0,0 +1,248 @@
+import os
+import shutil
+import tempfile
+import threading
+from typing import Iterable, Iterator, Optional
+from PySide6.QtCore import QObject, QRunnable, Signal
+from gitreader import GitObjectReader
+from patch import apply_patch, split_lines
+
+CHUNK_SIZE = 64 * 1024
+
+# The umask can only be read by setting it, which affects every thread, so it
+# is read once here at import time on the UI thread
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class OperationCancelled(Exception):
+    """Raised inside a worker when its operation has been cancelled."""
+    def __init__(self, message: str = "Operation cancelled"):
+        super().__init__(message)
+
+
+class FileWorkerSignals(QObject):
+    """
+    Signals emitted by a FileWorker. QRunnable is not a QObject, so the
+    signals live on a separate object created on the UI thread; emitting
+    them from the pool thread queues delivery back onto the UI thread.
+    """
+    progress = Signal(int)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class FileWorker(QRunnable):
+    """
+    Base class for file operations run on the global QThreadPool.
+
+    Subclasses implement work(), calling check_cancelled() between chunks
+    and report_progress() as they go. The result of work() is emitted
+    through signals.finished.
+    """
+    def __init__(self, filename: str):
+        super().__init__()
+        self.filename = filename
+        self.signals = FileWorkerSignals()
+        self._cancel_event = threading.Event()
+        self._last_percent = -1
+
+    def cancel(self) -> None:
+        """
+        Requests cancellation. The worker stops at the next chunk boundary.
+        """
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        """
+        Raises:
+            OperationCancelled: If cancel() has been called.
+        """
+        if self._cancel_event.is_set():
+            raise OperationCancelled()
+
+    def report_progress(self, done: int, total: int) -> None:
+        """
+        Emits progress as a percentage, only when the percentage changes.
+        """
+        percent = 100 if total <= 0 else min(100, done * 100 // total)
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self.signals.progress.emit(percent)
+
+    def work(self):
+        raise NotImplementedError
+
+    def run(self) -> None:
+        try:
+            result = self.work()
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+class LoadWorker(FileWorker):
+    """
+    Reads a text file in chunks and returns its lines (with line endings).
+    """
+    def work(self) -> list[str]:
+        total = os.path.getsize(self.filename)
+        chunks = []
+        with open(self.filename, 'r', encoding='utf-8') as file:
+            while True:
+                self.check_cancelled()
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                self.report_progress(file.buffer.tell(), total)
+        self.report_progress(total, total)
+        return split_lines("".join(chunks))
+
+
+class RevisionLoadWorker(FileWorker):
+    """
+    Reads a 'rev:path' spec through the shared GitObjectReader.
+    """
+    def work(self) -> list[str]:
+        self.check_cancelled()
+        lines = GitObjectReader().read_lines(self.filename)
+        self.report_progress(1, 1)
+        return lines
+
+
+class SaveWorker(FileWorker):
+    """
+    Streams pieces of text to a temporary file next to the target, fsyncs it
+    and atomically renames it over the target. The original file is left
+    untouched if the save fails or is cancelled.
+
+    Symlinks are resolved first so the file they point at is replaced, not
+    the link. A file with several hard links is detached from the others.
+    """
+    def __init__(self, filename: str, chunks: Iterable[str], total: int):
+        """
+        Args:
+            filename (str): Path of the file to write.
+            chunks (Iterable[str]): Text to write, consumed lazily. Pieces may
+                be as small as single lines; writes are buffered.
+            total (int): Number of pieces, used for progress reporting.
+        """
+        super().__init__(filename)
+        self.chunks = chunks
+        self.total = total
+
+    def work(self) -> str:
+        target = os.path.realpath(self.filename)
+        directory = os.path.dirname(target)
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.{}.'.format(os.path.basename(target)),
+            suffix='.tmp',
+            dir=directory
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                for done, chunk in enumerate(self.chunks, 1):
+                    self.check_cancelled()
+                    file.write(chunk)
+                    self.report_progress(done, self.total)
+                file.flush()
+                os.fsync(file.fileno())
+
+            self.check_cancelled()
+            copy_file_mode(target, temp_path)
+            os.replace(temp_path, target)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        fsync_directory(directory)
+        self.report_progress(self.total, self.total)
+        return self.filename
+
+
+class PatchApplyWorker(FileWorker):
+    """
+    Streams a patch file into apply_patch() against a snapshot of the
+    editor text. The snapshot is kept so the caller can check the editor
+    has not changed before using the result, a (lines, failed hunk
+    numbers) tuple.
+    """
+    def __init__(self, filename: str, text: str):
+        super().__init__(filename)
+        self.text = text
+
+    def work(self) -> tuple[list[str], list[int]]:
+        total = os.path.getsize(self.filename)
+        with open(self.filename, 'r', encoding='utf-8') as file:
+            return apply_patch(split_lines(self.text), self._iter_lines(file, total))
+
+    def _iter_lines(self, file, total: int) -> Iterator[str]:
+        for number, line in enumerate(file):
+            if number % 1024 == 0:
+                self.check_cancelled()
+                self.report_progress(file.buffer.tell(), total)
+            yield line
+
+
+def iter_text_chunks(text: str, size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yields successive slices of text without building an intermediate list.
+    """
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def chunk_count(text: str, size: int = CHUNK_SIZE) -> int:
+    return -(-len(text) // size)
+
+
+def copy_file_mode(source: str, target: str) -> None:
+    """
+    Gives target the permission bits, owner and group of source, or the
+    default permissions for a new file (respecting the umask) if source
+    does not exist yet. mkstemp always creates files as 0600.
+    """
+    if not os.path.exists(source):
+        os.chmod(target, 0o666 & ~UMASK)
+        return
+
+    shutil.copymode(source, target)
+    if hasattr(os, 'chown'):
+        stat = os.stat(source)
+        try:
+            os.chown(target, stat.st_uid, stat.st_gid)
+        except PermissionError:
+            # Only root may give a file away; keep the group if allowed
+            try:
+                os.chown(target, -1, stat.st_gid)
+            except PermissionError:
+                pass
+
+
+def fsync_directory(directory: str) -> None:
+    """
+    Flushes a directory entry so a rename survives a crash. Directories
+    cannot be opened for syncing on Windows, so this is a no-op there.
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd: Optional[int] = None
+    try:
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        if fd is not None:
+            os.close(fd)
@@ -0,0 +1,227 @@
+import io
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+class GitObjectError(Exception):
+    """Raised when a git revision spec cannot be resolved to a blob."""
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def parse_revision_spec(spec: str) -> Optional[Tuple[str, str]]:
+    """
+    Splits a 'rev:path' spec (e.g. 'HEAD~2:dualviewer.py') into its parts.
+
+    Plain filesystem paths, including Windows drive paths such as 'C:\\file.py'
+    and existing files whose names contain a colon, are not revision specs.
+
+    Args:
+        spec (str): The text entered for a file path.
+
+    Returns:
+        Optional[Tuple[str, str]]: (rev, path), or None for a plain path.
+    """
+    spec = spec.strip()
+    if re.match(r'^[A-Za-z]:[\\/]', spec) or ':' not in spec:
+        return None
+
+    rev, path = spec.split(':', 1)
+    if not rev or not path or os.path.exists(spec):
+        return None
+    return rev, path
+
+
+class GitObjectReader:
+    """
+    A singleton that reads blobs through one long-lived
+    'git cat-file --batch-command' process per repository.
+
+    Blob contents are cached by object id since blobs are immutable, so
+    revisiting a revision (or a revision where the file did not change)
+    costs a single 'info' round trip. The cache is an LRU bounded by
+    CACHE_BYTES of blob data; an evicted blob is simply fetched again.
+    """
+    CACHE_BYTES: int = 256 * 1024 * 1024
+    _instance: Optional["GitObjectReader"] = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls) -> "GitObjectReader":
+        """
+        Ensures only a single instance of GitObjectReader is created (Singleton pattern).
+        The first call may come from several worker threads at once.
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._processes = {}
+                instance._repo_roots = {}
+                instance._blobs = OrderedDict()
+                instance._cached_bytes = 0
+                instance._lock = threading.Lock()
+                cls._instance = instance
+        return cls._instance
+
+    def read_lines(self, spec: str) -> List[str]:
+        """
+        Reads the blob named by a 'rev:path' spec as text lines.
+
+        Args:
+            spec (str): A spec accepted by parse_revision_spec. The path is a
+                filesystem path (absolute or relative to the working directory)
+                inside a git work tree.
+
+        Returns:
+            List[str]: The blob's lines with universal newlines applied.
+
+        Raises:
+            GitObjectError: If the spec is invalid or does not name a blob.
+        """
+        parsed = parse_revision_spec(spec)
+        if parsed is None:
+            raise GitObjectError("Not a revision spec: {}".format(spec))
+        rev, path = parsed
+
+        with self._lock:
+            root, relpath = self._locate(path)
+            oid, obj_type, _ = self._info(root, '{}:{}'.format(rev, relpath))
+            if obj_type != 'blob':
+                raise GitObjectError("{} is a {}, not a file".format(spec, obj_type))
+
+            if oid in self._blobs:
+                self._blobs.move_to_end(oid)
+                return list(self._blobs[oid][0])
+
+            data = self._contents(root, oid)
+            lines = io.StringIO(data.decode('utf-8'), newline=None).readlines()
+            self._cache_blob(oid, lines, len(data))
+            return list(lines)
+
+    def _cache_blob(self, oid: str, lines: List[str], size: int) -> None:
+        """
+        Adds a blob to the cache, evicting the least recently used blobs until
+        the cache fits CACHE_BYTES. The newest blob is always kept.
+        """
+        self._blobs[oid] = (lines, size)
+        self._cached_bytes += size
+        while self._cached_bytes > self.CACHE_BYTES and len(self._blobs) > 1:
+            _, (_, evicted) = self._blobs.popitem(last=False)
+            self._cached_bytes -= evicted
+
+    def close(self) -> None:
+        """
+        Terminates every cat-file process. The blob cache is kept.
+        """
+        with self._lock:
+            for process in self._processes.values():
+                self._stop(process)
+            self._processes.clear()
+
+    def _locate(self, path: str) -> Tuple[str, str]:
+        """
+        Finds the work tree containing path.
+
+        Returns:
+            Tuple[str, str]: The repository root and the path relative to it,
+                using '/' separators as git expects.
+        """
+        path = os.path.abspath(path)
+
+        # The file may not exist in the work tree any more, so start from the
+        # closest existing directory
+        directory = path if os.path.isdir(path) else os.path.dirname(path)
+        while not os.path.isdir(directory) and os.path.dirname(directory) != directory:
+            directory = os.path.dirname(directory)
+
+        root = self._repo_roots.get(directory)
+        if root is None:
+            result = subprocess.run(
+                ['git', '-C', directory, 'rev-parse', '--show-toplevel'],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise GitObjectError("Not inside a git repository: {}".format(path))
+            root = os.path.normpath(result.stdout.strip())
+            self._repo_roots[directory] = root
+
+        relpath = os.path.relpath(os.path.realpath(path), os.path.realpath(root))
+        if relpath.startswith(os.pardir):
+            raise GitObjectError("{} is outside of repository {}".format(path, root))
+        return root, relpath.replace(os.sep, '/')
+
+    def _process(self, root: str) -> subprocess.Popen:
+        process = self._processes.get(root)
+        if process is None or process.poll() is not None:
+            process = subprocess.Popen(
+                ['git', 'cat-file', '--batch-command'],
+                cwd=root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+            self._processes[root] = process
+        return process
+
+    def _command(self, root: str, command: str) -> Tuple[subprocess.Popen, bytes]:
+        """
+        Sends one command and returns the process with its header line.
+        A process that died since the last call is restarted once.
+        """
+        for _ in range(2):
+            process = self._process(root)
+            try:
+                process.stdin.write(command.encode('utf-8') + b'\n')
+                process.stdin.flush()
+                header = process.stdout.readline()
+            except (BrokenPipeError, OSError):
+                header = b''
+            if header:
+                return process, header.rstrip(b'\n')
+            self._stop(process)
+            del self._processes[root]
+        raise GitObjectError("git cat-file exited unexpectedly")
+
+    @staticmethod
+    def _parse_header(header: bytes, name: str) -> Tuple[str, str, int]:
+        """
+        Parses an '<oid> <type> <size>' header line.
+
+        Raises:
+            GitObjectError: If git answered '<name> missing' or '<name> ambiguous'.
+                The name may contain spaces, so the answer is matched by suffix.
+        """
+        text = header.decode('utf-8', 'replace')
+        if text.endswith((' missing', ' ambiguous')):
+            raise GitObjectError("Could not resolve {}: {}".format(name, text.rsplit(' ', 1)[1]))
+
+        parts = text.split(' ')
+        if len(parts) != 3 or not parts[2].isdigit():
+            raise GitObjectError("Could not resolve {}".format(name))
+        oid, obj_type, size = parts
+        return oid, obj_type, int(size)
+
+    def _info(self, root: str, name: str) -> Tuple[str, str, int]:
+        _, header = self._command(root, 'info {}'.format(name))
+        return self._parse_header(header, name)
+
+    def _contents(self, root: str, oid: str) -> bytes:
+        process, header = self._command(root, 'contents {}'.format(oid))
+        _, _, size = self._parse_header(header, oid)
+        data = process.stdout.read(size)
+        process.stdout.read(1)
+        return data
+
+    @staticmethod
+    def _stop(process: subprocess.Popen) -> None:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,309 @@
+import io
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+Opcode = Tuple[str, int, int, int, int]
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+NO_NEWLINE_MARKER = '\\ No newline at end of file\n'
+
+
+class PatchError(Exception):
+    """Raised when a patch file cannot be parsed."""
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+@dataclass
+class Hunk:
+    """
+    One '@@' block of a unified diff.
+
+    Attributes:
+        old_start (int): 1-based start line in the original file, as written in the header.
+        old_count (int): Number of original lines the hunk covers.
+        lines (List[Tuple[str, str]]): (tag, text) pairs where tag is ' ', '-' or '+'.
+    """
+    old_start: int
+    old_count: int
+    lines: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def split_lines(text: str) -> List[str]:
+    """
+    Splits text into lines with their endings, on '\n' only. str.splitlines
+    also breaks on form feeds, '\x85', '\u2028' and friends, which diff and
+    patch tools treat as ordinary characters.
+    """
+    return io.StringIO(text, newline='\n').readlines()
+
+
+def group_opcodes(opcodes: List[Opcode], n: int = 3) -> Iterator[List[Opcode]]:
+    """
+    Groups SequenceMatcher opcodes into hunks with up to n lines of context,
+    the same way SequenceMatcher.get_grouped_opcodes does, but from opcodes
+    that have already been computed.
+
+    Args:
+        opcodes (List[Opcode]): Output of SequenceMatcher.get_opcodes().
+        n (int): Lines of context around each change.
+
+    Yields:
+        List[Opcode]: The opcodes making up one hunk.
+    """
+    codes = list(opcodes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # Split long stretches of unchanged lines into separate hunks
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def diff_line_count(opcodes: List[Opcode], n: int = 3) -> int:
+    """
+    Returns how many items iter_unified_diff yields for these opcodes,
+    without rendering anything.
+    """
+    total = 0
+    for group in group_opcodes(opcodes, n):
+        total += 1
+        for tag, i1, i2, j1, j2 in group:
+            if tag != 'insert':
+                total += i2 - i1
+            if tag in ('replace', 'insert'):
+                total += j2 - j1
+    return total + 1 if total else 0
+
+
+def iter_unified_diff(lines1: List[str], lines2: List[str], opcodes: List[Opcode],
+                      fromfile: str = '', tofile: str = '', n: int = 3) -> Iterator[str]:
+    """
+    Lazily renders a unified diff from already computed opcodes, one line
+    at a time, so not even a single hunk is held in memory.
+
+    Args:
+        lines1 (List[str]): Original lines, with line endings.
+        lines2 (List[str]): Changed lines, with line endings.
+        opcodes (List[Opcode]): SequenceMatcher opcodes for lines1 -> lines2.
+        fromfile (str): Name written on the '---' line.
+        tofile (str): Name written on the '+++' line.
+        n (int): Lines of context around each change.
+
+    Yields:
+        str: The file header, then each hunk header and diff line. A line
+            without a trailing newline comes with its '\\ No newline' marker.
+    """
+    def format_range(start: int, stop: int) -> str:
+        length = stop - start
+        beginning = start + 1 if length else start
+        return str(beginning) if length == 1 else '{},{}'.format(beginning, length)
+
+    def format_lines(prefix: str, lines: List[str]) -> Iterator[str]:
+        for line in lines:
+            if line.endswith('\n'):
+                yield prefix + line
+            else:
+                yield prefix + line + '\n' + NO_NEWLINE_MARKER
+
+    started = False
+    for group in group_opcodes(opcodes, n):
+        if not started:
+            started = True
+            yield '--- {}\n+++ {}\n'.format(fromfile, tofile)
+
+        first, last = group[0], group[-1]
+        yield '@@ -{} +{} @@\n'.format(
+            format_range(first[1], last[2]),
+            format_range(first[3], last[4])
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                yield from format_lines(' ', lines1[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                yield from format_lines('-', lines1[i1:i2])
+            if tag in ('replace', 'insert'):
+                yield from format_lines('+', lines2[j1:j2])
+
+
+def iter_hunks(patch_lines: Iterable[str]) -> Iterator[Hunk]:
+    """
+    Parses unified diff hunks from an iterable of lines (e.g. an open file)
+    without reading the whole patch first.
+
+    Raises:
+        PatchError: If a hunk is truncated or the patch touches several files.
+    """
+    hunk = None
+    old_left = new_left = 0
+    files = 0
+
+    for line in patch_lines:
+        if line.startswith('\\'):
+            # The previous line has no trailing newline
+            if hunk is not None and hunk.lines:
+                tag, text = hunk.lines[-1]
+                hunk.lines[-1] = (tag, text.rstrip('\n'))
+            continue
+
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            tag, text = line[:1], line[1:]
+            if line in ('\n', ''):
+                # Editors often strip the space from empty context lines
+                tag, text = ' ', '\n'
+            if tag not in ' -+':
+                raise PatchError("Malformed hunk line: {!r}".format(line))
+            hunk.lines.append((tag, text))
+            if tag != '+':
+                old_left -= 1
+            if tag != '-':
+                new_left -= 1
+            continue
+
+        if hunk is not None:
+            yield hunk
+            hunk = None
+
+        if line.startswith('--- '):
+            files += 1
+            if files > 1:
+                raise PatchError("Patch changes more than one file")
+            continue
+
+        match = HUNK_HEADER.match(line)
+        if match:
+            old_start, old_count, _, new_count = match.groups()
+            old_count = 1 if old_count is None else int(old_count)
+            new_count = 1 if new_count is None else int(new_count)
+            hunk = Hunk(int(old_start), old_count)
+            old_left, new_left = old_count, new_count
+
+    if hunk is not None:
+        if old_left > 0 or new_left > 0:
+            raise PatchError("Patch ends in the middle of a hunk")
+        yield hunk
+
+
+def line_key(line: str) -> str:
+    return line[:-1] if line.endswith('\n') else line
+
+
+def build_line_index(lines: List[str]) -> Dict[str, List[int]]:
+    """
+    Maps each line's text (without its newline) to the sorted positions
+    where it occurs.
+    """
+    index: Dict[str, List[int]] = {}
+    for position, line in enumerate(lines):
+        index.setdefault(line_key(line), []).append(position)
+    return index
+
+
+def find_hunk(lines: List[str], index: Dict[str, List[int]], old: List[str],
+              expected: int, lowest: int) -> int:
+    """
+    Finds where old occurs in lines, closest to the expected position and
+    not before lowest. Candidates come from the line index entry of the
+    rarest line in old, so only a handful of positions are ever compared.
+
+    Returns:
+        int: The start position, or -1 if old does not occur.
+    """
+    if not old:
+        return min(max(expected, lowest), len(lines))
+
+    keys = [line_key(line) for line in old]
+    anchor = min(range(len(keys)), key=lambda i: len(index.get(keys[i], ())))
+    positions = index.get(keys[anchor], [])
+
+    best = -1
+    for position in positions[bisect_left(positions, lowest + anchor):]:
+        start = position - anchor
+        if start + len(keys) > len(lines):
+            break
+        if best != -1 and start - expected >= abs(best - expected):
+            break
+        if all(line_key(lines[start + i]) == key for i, key in enumerate(keys)):
+            if best == -1 or abs(start - expected) < abs(best - expected):
+                best = start
+    return best
+
+
+def apply_patch(lines: List[str], patch_lines: Iterable[str], fuzz: int = 2) -> Tuple[List[str], List[int]]:
+    """
+    Applies a unified diff to lines. Hunks that are not at their stated
+    position are located by offset search through a line-hash index; if
+    that fails, up to fuzz lines of outer context are ignored, like patch(1).
+
+    Args:
+        lines (List[str]): The original lines, with line endings.
+        patch_lines (Iterable[str]): Lines of the patch, consumed lazily.
+        fuzz (int): Maximum context lines to drop from each end of a hunk.
+
+    Returns:
+        Tuple[List[str], List[int]]: The patched lines and the 1-based
+            numbers of hunks that could not be applied.
+
+    Raises:
+        PatchError: If the patch cannot be parsed or contains no unified diff hunks.
+    """
+    index = build_line_index(lines)
+    result: List[str] = []
+    failed: List[int] = []
+    cursor = 0
+    offset = 0
+    number = 0
+
+    for number, hunk in enumerate(iter_hunks(patch_lines), 1):
+        expected = (hunk.old_start - 1 if hunk.old_count else hunk.old_start) + offset
+
+        start = -1
+        for level in range(fuzz + 1):
+            # Drop up to `level` context lines from each end of the hunk
+            body = hunk.lines
+            front = 0
+            while front < level and front < len(body) and body[front][0] == ' ':
+                front += 1
+            back = 0
+            while back < level and back < len(body) - front and body[-1 - back][0] == ' ':
+                back += 1
+            if level and front < level and back < level:
+                break
+            body = body[front:len(body) - back]
+
+            old = [text for tag, text in body if tag != '+']
+            start = find_hunk(lines, index, old, expected + front, cursor)
+            if start != -1:
+                break
+
+        if start == -1:
+            failed.append(number)
+            continue
+
+        result.extend(lines[cursor:start])
+        result.extend(text for tag, text in body if tag != '-')
+        cursor = start + len(old)
+        offset = start - front - (hunk.old_start - 1 if hunk.old_count else hunk.old_start)
+
+    # Context diffs, binary patches or plain text would otherwise look like a no-op success
+    if number == 0:
+        raise PatchError("No hunks found")
+
+    result.extend(lines[cursor:])
+    return result, failed